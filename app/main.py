@@ -1,14 +1,19 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.datastructures import Headers
 from pydantic import BaseModel
-import csv
-import json
+import asyncio
+import gzip
+import hashlib
 import os
-import ast
 import sys
-from typing import AsyncGenerator
+import uuid
+import orjson
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Optional
 
 # Add project root to python path so we can import 'app' module when running directly
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -23,11 +28,52 @@ from langchain_core.messages import HumanMessage
 from dotenv import load_dotenv
 
 # Import our tools
-from app.tools import TOOLS
+from app.tools import HIGHLIGHT_PREFIX, TOOLS, preload as preload_tools
 
 load_dotenv()
 
-app = FastAPI()
+class ORJSONResponse(JSONResponse):
+    """JSONResponse rendered by orjson (FastAPI's bundled ORJSONResponse is deprecated)."""
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """True if an Accept-Encoding header allows gzip with a non-zero q-value (explicitly or via *)."""
+    qualities = {}
+    for part in accept_encoding.lower().split(","):
+        coding, *params = (p.strip() for p in part.split(";"))
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding] = q
+    # An explicit gzip entry takes precedence over the wildcard
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+class QValueGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that honours q-values; Starlette only looks for the substring "gzip"."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not _accepts_gzip(Headers(scope=scope).get("accept-encoding", "")):
+            # Hide a refused Accept-Encoding (e.g. gzip;q=0) from the middleware and the routes
+            scope = dict(scope, headers=[(k, v) for k, v in scope["headers"] if k != b"accept-encoding"])
+        await super().__call__(scope, receive, send)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Agent setup and grid scoring are independent, so run them side by side off the event loop
+    grid_init = asyncio.to_thread(cache_grid)
+    if GOOGLE_API_KEY:
+        app.state.agent, app.state.grid = await asyncio.gather(asyncio.to_thread(initialize_agent), grid_init)
+    else:
+        app.state.agent, app.state.grid = None, await grid_init
+    yield
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -35,8 +81,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Session-Id"],
 )
 
+# Compress large JSON bodies like /api/grid (text/event-stream is excluded by default)
+app.add_middleware(QValueGZipMiddleware, minimum_size=1024)
+
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -128,7 +178,7 @@ TOOLS AVAILABLE:
    - Does NOT highlight tiles
 
 2. query_and_highlight(code): Execute Python/Pandas code to find tiles AND automatically highlight them.
-   - Assign result to variable 'result_rows' as list of {'row': X, 'col': Y} dicts
+   - Assign result to variable 'result_rows' as a DataFrame with 'row'/'col' columns (e.g. df[mask][['row', 'col']]) or a list of {'row': X, 'col': Y} dicts
    - Use for: "find top 5 richest tiles", "show all deep tiles", etc.
    - Automatically highlights the results
 
@@ -139,6 +189,7 @@ TOOLS AVAILABLE:
 IMPORTANT NOTES:
 - List columns (like resource_economic_value, life_species, etc.) contain Python lists when multiple items exist for a cell
 - Use pandas operations to filter, sort, and analyze the data
+- The code can also use 'tiles', df indexed by (row, col); use tiles.loc[(row, col)] instead of filtering df when you already know the coordinates. In 'tiles', row and col are index levels, not columns (use tiles.reset_index() to get them back)
 - When user asks to "find" or "show" tiles, use query_and_highlight (it auto-highlights)
 - When user asks "how many" or wants statistics, use query_data (no highlighting)
 - Economic value is stored in resource_economic_value as a list of values
@@ -150,86 +201,157 @@ IMPORTANT NOTES:
         checkpointer=checkpointer,
         system_prompt=system_prompt,
     )
+
+    # Load the tools' data here, off the event loop, not inside the first chat turn
+    preload_tools()
     
     return agent
 
-agent = initialize_agent() if GOOGLE_API_KEY else None
-thread_id = 0
-
 class ChatRequest(BaseModel):
     message: str
+    session_id: Optional[str] = None  # Conversation memory key; if omitted a new one is generated and returned in X-Session-Id
 
 # --- ENDPOINTS ---
 
-def safe_eval(val):
-    if not val:
-        return []
-    try:
-        val = val.strip()
-        if val.startswith('[') and val.endswith(']'):
-            return ast.literal_eval(val)
-        return val
-    except (ValueError, SyntaxError):
-        return []
-
 @app.get("/")
 async def read_index():
     return FileResponse('app/static/index.html')
 
-@app.get("/api/grid")
-async def get_grid():
-    optimizer = AbyssalOptimizer()
+GRID_PATH = 'merged.csv'
+
+DEFAULT_WEIGHTS = {
+    'value': 1.0,
+    'difficulty': 1.0,
+    'impact': 2.0,
+    'hazard': 2.0
+}
+
+def build_grid():
+    """Scores every cell and returns the grid column-wise. Returns None if the CSV is missing.
+
+    Layout: {"length": N, "columns": {field: [...]}, "full_data": {csv_column: [...]}},
+    where index i of every list describes the same cell.
+    """
+    optimizer = AbyssalOptimizer(GRID_PATH)
     
     # Load data
     if not optimizer.load_data():
-        return {"error": "merged.csv not found"}
+        return None
         
     # Calculate scores with default weights
-    weights = {
-        'value': 1.0,
-        'difficulty': 1.0,
-        'impact': 2.0,
-        'hazard': 2.0
-    }
-    
-    scored_data = optimizer.calculate_scores(weights)
+    columns = optimizer.calculate_scores(DEFAULT_WEIGHTS)
     
-    # Now load full CSV data to add full_data field
-    filepath = 'merged.csv'
-    full_data_map = {}  # Map (row, col) -> full_data dict
-    
-    if os.path.exists(filepath):
-        with open(filepath, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                full_data = {}
-                for k, v in row.items():
-                    if v and v.strip():
-                        if v.strip().startswith('[') and v.strip().endswith(']'):
-                            full_data[k] = safe_eval(v)
-                        else:
-                            try:
-                                if '.' in v:
-                                    full_data[k] = float(v)
-                                else:
-                                    full_data[k] = int(v)
-                            except ValueError:
-                                full_data[k] = v
-                
-                key = (int(row['row']), int(row['col']))
-                full_data_map[key] = full_data
-    
-    # Merge full_data into scored_data
-    for item in scored_data:
-        key = (item['row'], item['col'])
-        item['full_data'] = full_data_map.get(key, {})
-    
-    return scored_data
+    return {
+        'length': len(columns['row']),
+        'columns': columns,
+        # Reuse the rows the optimizer already parsed for the full_data field
+        'full_data': optimizer.get_full_data_columns(),
+    }
 
-async def generate_response(user_message: str) -> AsyncGenerator[str, None]:
-    global agent, thread_id
-    
-    config = {"configurable": {"thread_id": thread_id}}
+def cache_grid():
+    """Builds and encodes the grid once. Returns {'body', 'gzip', 'etag'}, or None if the CSV is missing."""
+    grid = build_grid()
+    if grid is None:
+        return None
+
+    body = orjson.dumps(grid, option=orjson.OPT_SERIALIZE_NUMPY)
+    return {
+        'body': body,
+        # Compressed once here; GZipMiddleware passes already-encoded bodies through
+        'gzip': gzip.compress(body),
+        # Tagged by content, not the CSV's mtime: the body also changes with the code
+        # that builds it, and a stale 304 would hand an old format to a new app.js
+        'etag': f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+    }
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against etag, as used for GET revalidation."""
+    if if_none_match.strip() == "*":
+        return True
+    tags = (t.strip() for t in if_none_match.split(","))
+    return etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+# merged.csv is static for the lifetime of the process, so the grid is
+# scored and serialized once at startup (see lifespan) instead of on every request.
+@app.get("/api/grid")
+async def get_grid(request: Request):
+    grid = request.app.state.grid
+    if grid is None:
+        return {"error": "merged.csv not found"}
+
+    # The gzip and identity bodies are different representations, so they get different strong tags
+    use_gzip = _accepts_gzip(request.headers.get("accept-encoding", ""))
+    etag = grid['etag'][:-1] + '-gz"' if use_gzip else grid['etag']
+    headers = {"ETag": etag}
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+
+    content = grid['gzip'] if use_gzip else grid['body']
+    return Response(content=content, media_type="application/json", headers=headers)
+
+# Keep proxies (nginx, Cloudflare) from buffering the chat stream
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+    "Connection": "keep-alive",
+}
+
+def _frame(obj) -> bytes:
+    """Encodes one chat stream message as a Server-Sent Events frame."""
+    return b"data: " + orjson.dumps(obj) + b"\n\n"
+
+def _parse_tiles(payload: str):
+    """Decodes a HIGHLIGHT: tile list; the tools emit it as JSON."""
+    return orjson.loads(payload)
+
+class HighlightBuffer:
+    """Collects a HIGHLIGHT: tool payload that may arrive split over several chunks."""
+
+    INCOMPLETE = _frame({"type": "text", "content": "⚠ Highlight error: incomplete tile list"})
+
+    def __init__(self):
+        self.pending = None
+
+    def feed(self, content) -> list:
+        """Takes one tools-node text chunk and returns the frames (bytes) ready to send."""
+        if not isinstance(content, str):
+            return []
+
+        frames = []
+        # Check if this is a highlight tool result with HIGHLIGHT: prefix
+        if content.startswith(HIGHLIGHT_PREFIX):
+            if self.pending is not None:
+                frames.append(self.INCOMPLETE)
+            self.pending = content[len(HIGHLIGHT_PREFIX):]
+        elif self.pending is not None:
+            self.pending += content
+        else:
+            return frames
+
+        # Only attempt a parse once the list can be complete
+        if not self.pending.endswith("]"):
+            return frames
+        try:
+            tiles = _parse_tiles(self.pending)
+        except orjson.JSONDecodeError:
+            return frames
+        self.pending = None
+
+        if isinstance(tiles, list) and len(tiles) > 0:
+            frames.append(_frame({"type": "highlight", "tiles": tiles}))
+        return frames
+
+    def close(self) -> list:
+        """Returns an error frame if a payload was left unfinished."""
+        return [self.INCOMPLETE] if self.pending is not None else []
+
+async def generate_response(agent, user_message: str, session_id: str) -> AsyncGenerator[bytes, None]:
+    config = {"configurable": {"thread_id": session_id}}
+    highlights = HighlightBuffer()
     
     try:
         async for token, metadata in agent.astream(
@@ -237,47 +359,44 @@ async def generate_response(user_message: str) -> AsyncGenerator[str, None]:
             config=config,
             stream_mode="messages"
         ):
-            if not token.content_blocks:
+            # The node is per-token metadata, shared by all of the token's blocks
+            node = metadata.get("langgraph_node")
+            if node not in ("model", "tools") or not token.content_blocks:
                 continue
             
             for message in token.content_blocks:
-                msg_type = message.get("type")
-                node = metadata.get("langgraph_node")
+                if message.get("type") != "text":
+                    continue
             
-                if msg_type == "text" and node == "model":
-                    yield json.dumps({"type": "text", "content": message["text"]}) + "\n"
-                    
-                elif msg_type == "text" and node == "tools":
+                if node == "model":
+                    yield _frame({"type": "text", "content": message["text"]})
+                else:
                     # Tool outputs come as text messages from the tools node
                     content = message.get("text", "")
                     print(f"[DEBUG] Tool output: {content[:150]}")
-                    
-                    # Check if this is a query_and_highlight result with HIGHLIGHT: prefix
-                    if isinstance(content, str) and content.startswith("HIGHLIGHT:"):
-                        try:
-                            tiles_str = content[10:]  # Remove "HIGHLIGHT:" prefix
-                            tiles = ast.literal_eval(tiles_str)
-                            
-                            if isinstance(tiles, list) and len(tiles) > 0:
-                                yield json.dumps({"type": "highlight", "tiles": tiles}) + "\n"
-
-                        except Exception as e:
-                            yield json.dumps({"type": "text", "content": f"⚠ Highlight error: {str(e)}"}) + "\n"
+                    for frame in highlights.feed(content):
+                        yield frame
                 
+        for frame in highlights.close():
+            yield frame
                        
     except Exception as e:
-        yield json.dumps({"type": "text", "content": f"Error: {str(e)}"}) + "\n"
+        yield _frame({"type": "text", "content": f"Error: {str(e)}"})
 
 @app.post("/api/chat")
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
+    agent = http_request.app.state.agent
     if not agent:
         async def error_gen():
-            yield json.dumps({"type": "text", "content": "API Key missing"}) + "\n"
-        return StreamingResponse(error_gen(), media_type="application/x-ndjson")
+            yield _frame({"type": "text", "content": "API Key missing"})
+        return StreamingResponse(error_gen(), media_type="text/event-stream", headers=STREAM_HEADERS)
     
+    # Echo the id back so clients that omitted one can continue the same conversation
+    session_id = request.session_id or str(uuid.uuid4())
     return StreamingResponse(
-        generate_response(request.message),
-        media_type="application/x-ndjson"
+        generate_response(agent, request.message, session_id),
+        media_type="text/event-stream",
+        headers={**STREAM_HEADERS, "X-Session-Id": session_id}
     )
 
 if __name__ == "__main__":
@@ -1,13 +1,349 @@
-import csv
 import ast
+import functools
 import json
 import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+# Columns in merged.csv that hold stringified lists like "['a', 'b']"
+LIST_COLUMNS = [
+    'hazard_type', 'hazard_severity', 'hazard_notes',
+    'life_species', 'life_avg_depth_m', 'life_density', 'life_threat_level',
+    'life_behavior', 'life_trophic_level', 'life_prey_species',
+    'poi_id', 'poi_category', 'poi_label', 'poi_description', 'poi_research_value',
+    'resource_type', 'resource_family', 'resource_abundance', 'resource_purity',
+    'resource_extraction_difficulty', 'resource_environmental_impact',
+    'resource_economic_value', 'resource_description',
+    'biome_predators', 'biome_prey', 'biome_interaction_strengths'
+]
+
+# Low-cardinality string columns, loaded dictionary-encoded (pandas category)
+CATEGORY_COLUMNS = ['biome', 'current_stability']
+
+# Numeric list columns fed to the scoring kernel
+SCORE_COLUMNS = [
+    'resource_economic_value', 'resource_abundance', 'resource_purity',
+    'resource_extraction_difficulty', 'resource_environmental_impact',
+    'life_density', 'life_threat_level',
+]
+
+# Cell count from which scoring is split across threads; below it a single
+# kernel call is sub-millisecond and pool start-up would dominate
+PARALLEL_MIN_CELLS = 200_000
+
+# Bumped whenever the cached frame's layout or dtypes change; caches written
+# under another version are rebuilt from the CSV
+CACHE_VERSION = '2'
+_CACHE_VERSION_KEY = b'abyssal_cache_version'
+
+# Hazard severity label -> penalty points
+SEVERITY_MAP = {'low': 1, 'medium': 2, 'high': 3, 'extreme': 5}
+
+def parse_list(val):
+    """Parses a stringified list cell (e.g. "['a', 'b']") into a list."""
+    if not isinstance(val, str):
+        return []
+    if val[:1] != '[':
+        # Whitespace around cells is rare, so only strip when the fast check fails
+        val = val.strip()
+        if val[:1] != '[':
+            return []
+    try:
+        # Cells are Python reprs; swapping quotes makes them valid JSON
+        return orjson.loads(val.replace("'", '"'))
+    except orjson.JSONDecodeError:
+        pass
+    try:
+        return ast.literal_eval(val)
+    except (ValueError, SyntaxError):
+        return []
+
+def parse_list_column(series):
+    """Parses a whole list column, decoding all of its list cells with one orjson call.
+
+    Cells written as JSON (see merge_abyssal_data.py) decode as-is; older
+    Python-repr cells are retried with quotes swapped, and if the column as a
+    whole still does not decode, each cell goes through parse_list.
+    """
+    values = series.tolist()
+    out = [[] for _ in values]
+    try:
+        # Vectorized string check; null and non-string cells come back False
+        is_list = series.str.startswith('[', na=False).to_numpy(dtype=bool)
+    except AttributeError:
+        # No string cells at all (e.g. an all-null column)
+        is_list = np.zeros(len(values), dtype=bool)
+    idx = np.flatnonzero(is_list).tolist()
+
+    # Only the rare non-null cells without a leading '[' need the per-cell parser
+    for i in np.flatnonzero(series.notna().to_numpy() & ~is_list):
+        out[i] = parse_list(values[i])
+
+    doc = '[' + ','.join(values[i] for i in idx) + ']'
+    for text in (doc, doc.replace("'", '"')):
+        try:
+            parsed = orjson.loads(text)
+        except orjson.JSONDecodeError:
+            continue
+        # A malformed cell such as "[1], [2]" would shift every later cell
+        if len(parsed) == len(idx) and all(isinstance(p, list) for p in parsed):
+            break
+    else:
+        parsed = [parse_list(values[i]) for i in idx]
+
+    for i, p in zip(idx, parsed):
+        out[i] = p
+    return out
+
+def intern_strings(lists):
+    """Interns the strings inside parsed list cells, in place, and returns the lists.
+
+    List columns repeat a handful of labels (species, hazard types, ...) across
+    thousands of cells; interning stores each distinct label once, a Python-level
+    dictionary encoding that keeps the cells as plain lists for tool code.
+    """
+    for lst in lists:
+        for i, v in enumerate(lst):
+            if isinstance(v, str):
+                lst[i] = sys.intern(v)
+    return lists
+
+def to_padded(series, mapping=None):
+    """Packs a list column into an (N, K) float32 matrix, K = longest cell, NaN-padded.
+
+    Row i holds cell i's items in order, so aligned columns (value/abundance/purity)
+    line up element-wise. Non-numeric items become NaN; if mapping is given, items
+    are looked up in it first (missing keys -> NaN).
+    """
+    lengths = series.map(len).to_numpy(dtype=np.int64)
+    flat = pd.Series([v for lst in series for v in lst], dtype=object)
+    if mapping is None:
+        values = pd.to_numeric(flat, errors='coerce').to_numpy(dtype=np.float32)
+    else:
+        # Encode items as category codes once, then gather weights; code -1
+        # (not a key) picks the trailing NaN
+        codes = pd.Categorical(flat, categories=list(mapping)).codes
+        weights = np.append(np.fromiter(mapping.values(), dtype=np.float32), np.nan)
+        values = weights[codes]
+
+    n = len(lengths)
+    matrix = np.full((n, int(lengths.max(initial=0))), np.nan, dtype=np.float32)
+    cells = np.repeat(np.arange(n), lengths)
+    starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    matrix[cells, np.arange(len(values)) - starts] = values
+    return matrix
+
+def numeric(series):
+    """Converts a scalar column to float64 in one pass; unparseable or missing values become 0."""
+    return pd.to_numeric(series, errors='coerce').fillna(0.0).astype(np.float64)
+
+def row_sum(matrix):
+    """Per-cell sum of a padded column, treating NaN as 0."""
+    return np.nansum(matrix, axis=1, dtype=np.float64)
+
+def row_mean(matrix):
+    """Per-cell mean of a padded column over non-NaN items, 0 for empty cells."""
+    # nanmean warns on all-NaN rows, so divide by the valid count explicitly
+    counts = np.count_nonzero(~np.isnan(matrix), axis=1)
+    sums = row_sum(matrix)
+    return np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+
+def score_kernel(padded, coral_cover, w_val, w_diff, w_imp, w_haz):
+    """Scores every cell from padded list columns. Returns (score, value, difficulty, impact, hazard)."""
+    # 1. Resource Value: value/abundance/purity are aligned per resource
+    total_value = row_sum(
+        padded['resource_economic_value'] * padded['resource_abundance'] * padded['resource_purity']
+    )
+
+    # 2. Extraction Difficulty
+    avg_difficulty = row_mean(padded['resource_extraction_difficulty'])
+
+    # 3. Environmental Impact
+    res_impact = row_sum(padded['resource_environmental_impact'])
+    life_density = row_sum(padded['life_density'])
+    threat_level_sum = row_sum(padded['life_threat_level'])
+
+    total_env_impact = res_impact + (coral_cover / 10.0) + (life_density * 10.0) + (threat_level_sum * 5.0)
+
+    # 4. Hazards
+    hazard_score = row_sum(padded['hazard_severity'])
+
+    # Final Score
+    score = (total_value * w_val) - \
+            (avg_difficulty * w_diff) - \
+            (total_env_impact * w_imp) - \
+            (hazard_score * w_haz)
+
+    return score, total_value, avg_difficulty, total_env_impact, hazard_score
+
+def score_blocks(padded, coral_cover, w_val, w_diff, w_imp, w_haz, workers=None):
+    """score_kernel, run over row blocks on a thread pool for large grids.
+
+    NumPy releases the GIL inside its reductions, so blocks score concurrently.
+    Grids under PARALLEL_MIN_CELLS are scored in one call.
+    """
+    n = len(coral_cover)
+    workers = workers or os.cpu_count() or 1
+    if n < PARALLEL_MIN_CELLS or workers < 2:
+        return score_kernel(padded, coral_cover, w_val, w_diff, w_imp, w_haz)
+
+    def run(lo, hi):
+        block = {col: matrix[lo:hi] for col, matrix in padded.items()}
+        return score_kernel(block, coral_cover[lo:hi], w_val, w_diff, w_imp, w_haz)
+
+    bounds = np.linspace(0, n, workers + 1, dtype=np.int64)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(run, bounds[:-1], bounds[1:]))
+    return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+def downcast(df):
+    """Narrows numeric columns in place wherever that loses nothing; returns df.
+
+    float64 columns become float32 only if every value survives the round trip
+    (grid coordinates, whole-number percentages, ...), and int64 columns become
+    int32 when their range fits. Measured values keep their exact CSV precision,
+    since tools and the sidebar/export show them as-is.
+    """
+    for col in df.select_dtypes(include='float64').columns:
+        values = df[col].to_numpy()
+        narrow = values.astype(np.float32)
+        if np.array_equal(narrow, values, equal_nan=True):
+            df[col] = narrow
+    info = np.iinfo(np.int32)
+    for col in df.select_dtypes(include='int64').columns:
+        values = df[col].to_numpy()
+        if len(values) == 0 or (values.min() >= info.min and values.max() <= info.max):
+            df[col] = values.astype(np.int32)
+    return df
+
+def top_indices(score, n):
+    """Indices of the n highest scores, best first, without sorting the whole array."""
+    n = max(0, min(n, len(score)))
+    if n == 0:
+        return np.empty(0, dtype=np.intp)
+    top = np.argpartition(-score, n - 1)[:n]
+    return top[np.argsort(-score[top], kind='stable')]
+
+def parquet_path(csv_path):
+    """The parsed-frame cache that sits next to a merged CSV."""
+    return os.path.splitext(csv_path)[0] + '.parquet'
+
+def read_merged_csv(path):
+    """Reads a merged CSV into a DataFrame with list columns decoded."""
+    # Memory-mapped, multi-threaded block parsing; empty cells become nulls like pandas
+    table = pv.read_csv(
+        pa.memory_map(path),
+        read_options=pv.ReadOptions(use_threads=True, block_size=1 << 20),
+        convert_options=pv.ConvertOptions(
+            strings_can_be_null=True,
+            column_types={col: pa.dictionary(pa.int32(), pa.string()) for col in CATEGORY_COLUMNS},
+        ),
+    )
+
+    df = table.to_pandas()
+    for col in LIST_COLUMNS:
+        if col in df.columns:
+            df[col] = intern_strings(parse_list_column(df[col]))
+    return downcast(df)
+
+def read_parquet(path):
+    """Reads a frame written by write_parquet; list columns come back as Python lists.
+
+    Raises ValueError if the file was written under a different CACHE_VERSION.
+    """
+    table = pq.read_table(path)
+    version = (table.schema.metadata or {}).get(_CACHE_VERSION_KEY, b'').decode()
+    if version != CACHE_VERSION:
+        raise ValueError(f"cache version {version or 'unknown'} != {CACHE_VERSION}")
+    list_cols = [col for col in LIST_COLUMNS if col in table.column_names]
+
+    df = table.drop_columns(list_cols).to_pandas()
+    for col in list_cols:
+        # to_pandas would hand back numpy arrays per cell; keep plain lists like the CSV path
+        lists = [v if v is not None else [] for v in table.column(col).to_pylist()]
+        df[col] = intern_strings(lists)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df[table.column_names]
+
+def write_parquet(df, path):
+    """Writes the parsed frame so later loads can skip CSV parsing entirely.
+
+    Written to a temp file in the same directory and renamed into place, so an
+    interrupted write never leaves a truncated cache at path.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.parquet.tmp')
+    os.close(fd)
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = {**(table.schema.metadata or {}), _CACHE_VERSION_KEY: CACHE_VERSION.encode()}
+        pq.write_table(table.replace_schema_metadata(metadata), tmp, compression='zstd')
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def _write_cache(df, path):
+    # Best effort: a read-only checkout or an unrepresentable column just means no cache
+    try:
+        write_parquet(df, path)
+    except (OSError, pa.ArrowException) as e:
+        print(f"Skipping parquet cache {path}: {e}")
+
+# lru_cache does not stop two threads from both missing and loading at once
+# (startup scores the grid and preloads the tools concurrently), so loads are
+# serialized and the second caller gets the first one's objects
+_load_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=4)
+def _load_merged(path, mtime):
+    """Loads a merged CSV once per (path, mtime), via its parquet cache when fresh. Returns (df, padded)."""
+    cache = parquet_path(path)
+    df = None
+    if os.path.exists(cache) and os.path.getmtime(cache) >= mtime:
+        try:
+            df = read_parquet(cache)
+        except (OSError, ValueError, pa.ArrowException) as e:
+            # A corrupt, unreadable or outdated cache is rebuilt from the CSV below
+            print(f"Ignoring unreadable parquet cache {cache}: {e}")
+    if df is None:
+        df = read_merged_csv(path)
+        _write_cache(df, cache)
+
+    padded = {col: to_padded(df[col]) for col in SCORE_COLUMNS}
+    padded['hazard_severity'] = to_padded(df['hazard_severity'], SEVERITY_MAP)
+    return df, padded
+
+def load_merged(filepath='merged.csv'):
+    """Returns the shared parsed (df, padded) for filepath; re-reads only if the file changed.
+
+    A merged.parquet next to the CSV that is at least as new is used instead of
+    parsing the CSV, and is (re)written whenever the CSV has to be parsed.
+    Safe to call from several threads; the file is parsed once.
+    The returned objects are shared across callers, so treat them as read-only.
+    Raises FileNotFoundError if the file does not exist.
+    """
+    path = os.path.abspath(filepath)
+    with _load_lock:
+        return _load_merged(path, os.path.getmtime(path))
 
 class AbyssalOptimizer:
     def __init__(self, filepath='merged.csv'):
         self.filepath = filepath
-        self.data = []
-        self.scored_data = []
+        self.df = None
+        self.padded = {}
+        self.scored_data = {}
+        self.grid = {}
         self.iucn_status = {}
         self._load_iucn_status()
 
@@ -23,139 +359,79 @@ class AbyssalOptimizer:
             self.iucn_status = {}
 
     def load_data(self):
-        """Loads the dataset using standard csv module."""
+        """Loads the dataset, reusing the process-wide parse of an unchanged file."""
         try:
-            with open(self.filepath, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                self.data = [row for row in reader]
-            return True
+            self.df, self.padded = load_merged(self.filepath)
         except FileNotFoundError:
             return False
+        return True
 
-    def _safe_eval(self, val):
-        """Safely evaluates a string representation of a list."""
-        if not val:
-            return []
-        try:
-            if val.startswith('[') and val.endswith(']'):
-                return ast.literal_eval(val)
-            return val
-        except (ValueError, SyntaxError):
-            return []
+    def get_full_data_columns(self):
+        """Returns every CSV column as a list in grid order (missing values are NaN/None)."""
+        return {col: self.df[col].tolist() for col in self.df.columns}
+
+    def calculate_scores(self, weights, top_n=None):
+        """Calculates scores for each cell based on weights.
+
+        Returns the scored grid column-wise: {field: values per cell}, where numeric
+        fields are NumPy arrays; self.grid holds them as (n_rows, n_cols) float32 grids.
+        With top_n, only the top_n highest-scoring cells are returned, best first
+        (self.grid still covers every cell).
+        """
+        w_val, w_diff, w_imp, w_haz = (weights[k] for k in ('value', 'difficulty', 'impact', 'hazard'))
+
+        df = self.df
+        coral_cover = numeric(df['coral_coral_cover_pct']).to_numpy(dtype=np.float64)
+        score, total_value, avg_difficulty, total_env_impact, hazard_score = score_blocks(
+            self.padded, coral_cover, w_val, w_diff, w_imp, w_haz
+        )
+
+        # Numeric fields live in fixed-shape (n_rows, n_cols) float32 grids, indexed
+        # by [row, col]; float32 is plenty for a heatmap and halves the footprint
+        rows = df['row'].to_numpy(dtype=np.int32)
+        cols = df['col'].to_numpy(dtype=np.int32)
+        # initial=-1 gives a (0, 0) grid for a CSV with a header but no rows
+        shape = (int(rows.max(initial=-1)) + 1, int(cols.max(initial=-1)) + 1)
+        fields = {
+            'lat': numeric(df['lat']),
+            'lon': numeric(df['lon']),
+            'depth': numeric(df['depth_m']),
+            'pressure': numeric(df['pressure_atm']),
+            'temp': numeric(df['temperature_c']),
+
+            # Optimization details
+            'score': score,
+            'total_value': total_value,
+            'difficulty': avg_difficulty,
+            'env_impact': total_env_impact,
+            'hazard_score': hazard_score,
+        }
+        self.grid = {}
+        for name, values in fields.items():
+            grid = np.full(shape, np.nan, dtype=np.float32)
+            grid[rows, cols] = values
+            self.grid[name] = grid
+
+        # Kept in grid order unless a ranking was asked for; the map colours cells
+        # by score and needs none
+        if top_n is not None:
+            top = top_indices(score, top_n)
+            df, rows, cols = df.iloc[top], rows[top], cols[top]
+
+        # Map life species to IUCN status
+        # We'll pass a parallel list of status codes (e.g. ['EN', 'LC'])
+        life_iucn = df['life_species'].map(
+            lambda life: [self.iucn_status.get(species, 'DD') for species in life]
+        )
+
+        self.scored_data = {'row': rows, 'col': cols, 'biome': df['biome'].astype(str).tolist()}
+        self.scored_data.update({name: grid[rows, cols] for name, grid in self.grid.items()})
+
+        # Lists for UI
+        # Using 'hazard_type' list for frontend tags
+        self.scored_data['hazards'] = df['hazard_type'].tolist()
+        self.scored_data['resources'] = df['resource_type'].tolist()
+        self.scored_data['life'] = df['life_species'].tolist()
+        self.scored_data['life_iucn'] = life_iucn.tolist()
 
-    def _get_float(self, val):
-        if not val:
-            return 0.0
-        try:
-            return float(val)
-        except ValueError:
-            return 0.0
-
-    def calculate_scores(self, weights):
-        """Calculates scores for each cell based on weights."""
-        # Helper to map hazard severity
-        severity_map = {'low': 1, 'medium': 2, 'high': 3, 'extreme': 5}
-        
-        self.scored_data = []
-        
-        for row in self.data:
-            # 1. Resource Value
-            res_values = self._safe_eval(row.get('resource_economic_value', '[]'))
-            res_abundance = self._safe_eval(row.get('resource_abundance', '[]'))
-            res_purity = self._safe_eval(row.get('resource_purity', '[]'))
-            
-            total_value = 0.0
-            if isinstance(res_values, list):
-                count = len(res_values)
-                for i in range(count):
-                    v = float(res_values[i]) if i < len(res_values) and res_values[i] is not None else 0
-                    a = float(res_abundance[i]) if i < len(res_abundance) and res_abundance[i] is not None else 0
-                    p = float(res_purity[i]) if i < len(res_purity) and res_purity[i] is not None else 0
-                    total_value += v * a * p
-
-            # 2. Extraction Difficulty
-            diff_list = self._safe_eval(row.get('resource_extraction_difficulty', '[]'))
-            if isinstance(diff_list, list) and diff_list:
-                clean_diff = [float(d) for d in diff_list if d is not None]
-                avg_difficulty = sum(clean_diff) / len(clean_diff) if clean_diff else 0
-            else:
-                avg_difficulty = 0
-
-            # 3. Environmental Impact
-            res_impact_list = self._safe_eval(row.get('resource_environmental_impact', '[]'))
-            if isinstance(res_impact_list, list):
-                res_impact = sum([float(i) for i in res_impact_list if i is not None])
-            else:
-                res_impact = 0
-            
-            coral_cover = self._get_float(row.get('coral_coral_cover_pct', '0'))
-            
-            life_density_list = self._safe_eval(row.get('life_density', '[]'))
-            if isinstance(life_density_list, list):
-                life_density = sum([float(l) for l in life_density_list if l is not None])
-            else:
-                life_density = 0
-            
-            threat_level_list = self._safe_eval(row.get('life_threat_level', '[]'))
-            if isinstance(threat_level_list, list):
-                threat_level_sum = sum([float(t) for t in threat_level_list if t is not None])
-            else:
-                threat_level_sum = 0
-            
-            total_env_impact = res_impact + (coral_cover / 10.0) + (life_density * 10.0) + (threat_level_sum * 5.0)
-
-            # 4. Hazards
-            hazard_severity_list = self._safe_eval(row.get('hazard_severity', '[]'))
-            hazard_score = 0
-            if isinstance(hazard_severity_list, list):
-                for h in hazard_severity_list:
-                    if h in severity_map:
-                        hazard_score += severity_map[h]
-            
-            # Final Score
-            score = (total_value * weights['value']) - \
-                    (avg_difficulty * weights['difficulty']) - \
-                    (total_env_impact * weights['impact']) - \
-                    (hazard_score * weights['hazard'])
-            
-            # Pass basic info plus score details
-            # Using 'hazard_type' list for frontend tags
-            hazards = self._safe_eval(row.get('hazard_type', '[]'))
-            resources = self._safe_eval(row.get('resource_type', '[]'))
-            life = self._safe_eval(row.get('life_species', '[]'))
-            
-            # Map life species to IUCN status
-            # We'll pass a parallel list of status codes (e.g. ['EN', 'LC'])
-            life_iucn = [self.iucn_status.get(species, 'DD') for species in life]
-
-            self.scored_data.append({
-                'row': int(row['row']),
-                'col': int(row['col']),
-                'lat': float(row['lat']),
-                'lon': float(row['lon']),
-                'depth': float(row['depth_m']),
-                'biome': row['biome'],
-                'pressure': float(row['pressure_atm']),
-                'temp': float(row['temperature_c']),
-                
-                # Optimization details
-                'score': score,
-                'total_value': total_value,
-                'difficulty': avg_difficulty,
-                'env_impact': total_env_impact,
-                'hazard_score': hazard_score,
-                
-                # Lists for UI
-                'hazards': hazards,
-                'resources': resources,
-                'life': life,
-                'life_iucn': life_iucn,
-                
-                # Preserve full raw data for generic view if needed, but filtered for clarity
-                # Actually, let's not duplicate everything, the fields above are sufficient for now
-            })
-            
-        # Normalize scores for heatmap (0-1 range if needed, but raw score is fine for now)
-        self.scored_data.sort(key=lambda x: x['score'], reverse=True)
-        
         return self.scored_data
@@ -46,27 +46,56 @@ document.addEventListener('DOMContentLoaded', () => {
     let allData = []; // Store loaded data
 
     // --- Data Fetching ---
+    // /api/grid is column-oriented: index i of every array describes the same cell
+    let fullDataColumns = {};
+
+    // Rebuild the full CSV record for a cell, skipping missing/empty values
+    function getFullData(index) {
+        const d = {};
+        for (const key in fullDataColumns) {
+            const val = fullDataColumns[key][index];
+            if (val === null || val === undefined) continue;
+            if (Array.isArray(val) && val.length === 0) continue;
+            d[key] = val;
+        }
+        return d;
+    }
+
     fetch('/api/grid')
         .then(response => {
             console.log('API response status:', response.status);
             return response.json();
         })
-        .then(data => {
-            console.log('Data received, length:', data.length);
-            if (data.error) {
-                console.error('API error:', data.error);
+        .then(payload => {
+            if (payload.error) {
+                console.error('API error:', payload.error);
                 return;
             }
+            const {length, columns} = payload;
+            fullDataColumns = payload.full_data;
+            console.log('Data received, length:', length);
+
             // Calculate max score for normalization
-            maxScore = Math.max(...data.map(d => d.score || 0));
+            maxScore = Math.max(...columns.score.map(s => s || 0));
             if (maxScore <= 0) maxScore = 1; // Avoid div by zero
             console.log('Max score:', maxScore);
             
-            allData = data.map(d => ({
-                ...d,
-                // Inverted depth: Shallow (Seamount) = Tall, Deep (Trench) = Short
-                elevation: (MAX_DEPTH - d.depth)
-            }));
+            // Lightweight per-cell objects holding only what the layer accessors read
+            allData = new Array(length);
+            for (let i = 0; i < length; i++) {
+                allData[i] = {
+                    index: i,
+                    row: columns.row[i],
+                    col: columns.col[i],
+                    lat: columns.lat[i],
+                    lon: columns.lon[i],
+                    depth: columns.depth[i],
+                    biome: columns.biome[i],
+                    score: columns.score[i],
+                    // Inverted depth: Shallow (Seamount) = Tall, Deep (Trench) = Short
+                    elevation: (MAX_DEPTH - columns.depth[i])
+                };
+            }
             console.log('Processed data, length:', allData.length);
             console.log('Initializing DeckGL...');
             initDeckGL(allData);
@@ -277,7 +306,8 @@ document.addEventListener('DOMContentLoaded', () => {
     }
     
     function setHighlights(tiles) {
-        highlightedCells = tiles;
+        // Tiles arrive as [row, col] or [row, col, color]
+        highlightedCells = tiles.map(([row, col, color]) => ({ row, col, color }));
         // Reset selection to let highlights take focus visually
         selectedCell = null;
         updateLayer(allData);
@@ -369,8 +399,8 @@ document.addEventListener('DOMContentLoaded', () => {
             const exportData = [];
             for (const h of highlightedCells) {
                 const match = allData.find(d => d.row === h.row && d.col === h.col);
-                if (match && match.full_data) {
-                    exportData.push(match.full_data);
+                if (match) {
+                    exportData.push(getFullData(match.index));
                 }
             }
             
@@ -450,6 +480,11 @@ document.addEventListener('DOMContentLoaded', () => {
         const btn = document.getElementById('chat-send');
         const msgContainer = document.getElementById('chat-messages');
 
+        // One conversation per page load; the server keys chat memory by this id
+        const sessionId = window.crypto && crypto.randomUUID
+            ? crypto.randomUUID()
+            : `${Date.now().toString(16)}-${Math.random().toString(16).slice(2)}`;
+
         const addMsg = (text, type) => {
             const div = document.createElement('div');
             div.className = `message ${type}`;
@@ -470,7 +505,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 const response = await fetch('/api/chat', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ message: text, thread_id: 123 })
+                    body: JSON.stringify({ message: text, session_id: sessionId })
                 });
 
                 if (!response.ok) throw new Error('Network response was not ok');
@@ -491,14 +526,14 @@ document.addEventListener('DOMContentLoaded', () => {
                     
                     buffer += decoder.decode(value, { stream: true });
                     
-                    // Process complete lines (NDJSON)
-                    const lines = buffer.split('\n');
-                    buffer = lines.pop(); // Keep incomplete chunk
+                    // Process complete Server-Sent Events ("data: {...}\n\n")
+                    const events = buffer.split('\n\n');
+                    buffer = events.pop(); // Keep incomplete chunk
                     
-                    for (const line of lines) {
-                        if (!line.trim()) continue;
+                    for (const event of events) {
+                        if (!event.startsWith('data: ')) continue;
                         try {
-                            const msg = JSON.parse(line);
+                            const msg = JSON.parse(event.slice(6));
                             if (msg.type === 'text') {
                                 botMsgDiv.textContent += msg.content;
                             } else if (msg.type === 'highlight') {
@@ -533,7 +568,7 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     function updateSidebar(cell) {
-        const d = cell.full_data;
+        const d = getFullData(cell.index);
 
         const formatVal = (key, val) => {
             if (Array.isArray(val)) {
@@ -1,45 +1,130 @@
+import functools
+import os
+import numpy as np
+import orjson
 import pandas as pd
-import ast
 from langchain.tools import tool
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any
 
-# Load data once for the tools
-DF = pd.read_csv('merged.csv')
-
-# Parse list columns from strings to actual lists
-# These columns contain stringified lists like "[item1, item2]"
-list_columns = [
-    'hazard_type', 'hazard_severity', 'hazard_notes',
-    'life_species', 'life_avg_depth_m', 'life_density', 'life_threat_level', 
-    'life_behavior', 'life_trophic_level', 'life_prey_species',
-    'poi_id', 'poi_category', 'poi_label', 'poi_description', 'poi_research_value',
-    'resource_type', 'resource_family', 'resource_abundance', 'resource_purity', 
-    'resource_extraction_difficulty', 'resource_environmental_impact', 
-    'resource_economic_value', 'resource_description',
-    'biome_predators', 'biome_prey', 'biome_interaction_strengths'
-]
+from app.optimizer import CATEGORY_COLUMNS, load_merged
 
+DATA_PATH = 'merged.csv'
+
+# Data for the tools, sharing the optimizer's parse of merged.csv.
+# Loaded on first use (see get_df), so importing this module stays cheap.
+# List columns (hazard_*, life_*, poi_*, resource_*, biome_*) hold actual lists
 # Note: current_stability is a STRING (e.g., "low", "medium", "high")
 # Note: current_flow_direction is mostly empty
 # Note: coral_* and current_u/v/speed are NUMERIC, not lists
+def data_version():
+    """The data file's mtime; tool frames and cached tool results are keyed on it."""
+    return os.path.getmtime(DATA_PATH)
+
+@functools.lru_cache(maxsize=1)
+def _frames(version):
+    """Builds (df, tiles) for one version of the data file; a newer file replaces them."""
+    # Shallow copy: with copy-on-write (always on from pandas 3, which requirements.txt
+    # pins), columns added or edited here stay local to this frame while the column
+    # buffers themselves are shared with the optimizer
+    df = load_merged(DATA_PATH)[0].copy(deep=False)
+    # The optimizer keeps biome/current_stability dictionary-encoded; tool code
+    # (and the system prompt) treat them as plain strings, so decode them here
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(df[col].cat.categories.dtype)
+
+    # Keyed by (row, col) so single-tile lookups are an index hit, not a scan. row/col
+    # move into the index (not kept as columns too, which makes ordinary calls like
+    # sort_values('row') ambiguous)
+    tiles = df.set_index(['row', 'col']).sort_index()
+    return df, tiles
+
+def get_df():
+    """Returns the frame tool code sees as 'df', reloading it if the data file changed."""
+    return _frames(data_version())[0]
+
+def get_tile_index():
+    """Returns get_df() keyed by (row, col)."""
+    return _frames(data_version())[1]
+
+def preload():
+    """Loads the tool frames ahead of the first tool call."""
+    get_tile_index()
+
+_MISSING = object()
+
+# Names every piece of tool code starts with; copied per call, never mutated
+_GLOBALS = {'__builtins__': __builtins__, 'pd': pd, 'np': np}
+
+# Marks tool output that main.py turns into a highlight event for the map
+HIGHLIGHT_PREFIX = "HIGHLIGHT:"
+
+def _validate_tiles(tiles, where):
+    """Keeps tiles whose row and col are finite numbers. Returns (coords, colors).
+
+    coords is an (N, 2) int32 array of [row, col]; colors is None when no kept
+    tile set one, else one color (or None) per kept tile. tiles may be a list of
+    dicts or a DataFrame with 'row'/'col' (and optionally 'color') columns.
+    Coordinates are coerced in one vectorized pass; anything that is not a
+    dict or lacks a usable row/col is dropped with a warning.
+    """
+    if isinstance(tiles, pd.DataFrame):
+        vdf = tiles
+        has_color = vdf['color'].notna().to_numpy() if 'color' in vdf.columns else None
+    else:
+        records = [t for t in tiles if isinstance(t, dict)]
+        vdf = pd.DataFrame.from_records(records)
+        # Missing keys read back as NaN, so track which tiles actually passed a color
+        has_color = np.array(['color' in t for t in records], dtype=bool) if 'color' in vdf.columns else None
 
-def safe_parse_list(val):
-    """Safely parse a string representation of a list into an actual list."""
-    if pd.isna(val) or val == '':
-        return []
-    if isinstance(val, str):
-        try:
-            if val.startswith('[') and val.endswith(']'):
-                return ast.literal_eval(val)
-        except (ValueError, SyntaxError):
-            pass
-    return []
-
-# Parse all list columns
-for col in list_columns:
-    if col in DF.columns:
-        DF[col] = DF[col].apply(safe_parse_list)
+    if 'row' not in vdf.columns or 'col' not in vdf.columns:
+        coords = np.empty((len(vdf), 2))
+        keep = np.zeros(len(vdf), dtype=bool)
+    else:
+        coords = vdf[['row', 'col']].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+        keep = np.isfinite(coords).all(axis=1)
+
+    dropped = len(tiles) - int(keep.sum())
+    if dropped:
+        print(f"[{where}] Warning: Skipping {dropped} invalid tile(s) (missing or non-numeric row/col)")
+
+    colors = None
+    if has_color is not None and has_color[keep].any():
+        colors = [c if has else None for c, has in zip(vdf['color'].to_numpy()[keep], has_color[keep])]
+    return coords[keep].astype(np.int32), colors
+
+def _highlight_payload(coords, colors):
+    """Serializes validated tiles as HIGHLIGHT:<JSON>, one [row, col] or [row, col, color] per tile.
+
+    Uncolored tiles go straight from the int32 array to JSON with no per-tile objects.
+    """
+    if colors is None:
+        tiles = coords
+    else:
+        tiles = [[r, c] if color is None else [r, c, color] for (r, c), color in zip(coords.tolist(), colors)]
+    return HIGHLIGHT_PREFIX + orjson.dumps(tiles, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+@functools.lru_cache(maxsize=1024)
+def _compile(code):
+    """Compiles tool code once per distinct source; the code object outlives result-cache entries."""
+    return compile(code, '<tool>', 'exec')
+
+@functools.lru_cache(maxsize=512)
+def _run_query(code, result_var, version):
+    """Executes tool code and returns its result_var (or _MISSING).
+
+    Agents often re-issue identical tool calls while retrying or planning, so
+    results are cached per (code, data version). Exceptions are not cached.
+    """
+    # One namespace for globals and locals, so helper functions and lambdas in the
+    # code can see its top-level names. The frames are fresh shallow copies, which
+    # copy-on-write turns into private data on first write, so a call that adds or
+    # edits columns cannot leak them into later (cached) calls.
+    df, tiles = _frames(version)
+    namespace = dict(_GLOBALS, df=df.copy(deep=False), tiles=tiles.copy(deep=False))
+    exec(_compile(code), namespace)
+    return namespace.get(result_var, _MISSING)
 
 class HighlightTilesInput(BaseModel):
     tiles: List[Dict[str, Any]] = Field(..., description="List of row/col dictionaries, optionally with color e.g. [{'row': 1, 'col': 2, 'color': [255, 0, 0]}, ...]")
@@ -55,21 +140,13 @@ def highlight_tiles(tiles: List[Dict[str, Any]]):
     IMPORTANT: Each tile MUST have both 'row' and 'col' keys.
     """
     # Validate that each tile has both row and col
-    validated_tiles = []
-    for tile in tiles:
-        if 'row' in tile and 'col' in tile:
-            t = {'row': int(tile['row']), 'col': int(tile['col'])}
-            if 'color' in tile:
-                t['color'] = tile['color']
-            validated_tiles.append(t)
-        else:
-            print(f"Warning: Skipping invalid tile (missing row or col): {tile}")
-    
-    if len(validated_tiles) == 0:
+    coords, colors = _validate_tiles(tiles, 'highlight_tiles')
+    
+    if len(coords) == 0:
         return "Error: No valid tiles provided. Each tile must have both 'row' and 'col' keys."
     
-    # Return the validated tiles as a string repr so the agent loop can capture it in the ToolMessage
-    return str(validated_tiles)
+    # Same format as query_and_highlight so main.py highlights these tiles too
+    return _highlight_payload(coords, colors)
 
 @tool("query_data")
 def query_data(code: str):
@@ -78,6 +155,9 @@ def query_data(code: str):
     Use this tool to get information, statistics, or answers WITHOUT highlighting tiles.
     
     The dataframe 'df' has columns like: 'row', 'col', 'depth_m', 'biome', 'resource_economic_value', etc.
+    'tiles' is df indexed by (row, col), so 'row' and 'col' are index levels there, not columns:
+    use tiles.loc[(row, col)] to look up specific tiles, and tiles.reset_index() to get them back as columns.
+    'pd' (pandas) and 'np' (NumPy) are already imported.
     
     You MUST assign the final result to a variable named 'result'.
     'result' can be a string, number, list, or any data you want to return to the user.
@@ -93,16 +173,17 @@ def query_data(code: str):
     # Get statistics
     df['total_econ'] = df['resource_economic_value'].apply(lambda x: sum(x) if len(x) > 0 else 0)
     result = f"Average economic value: {df['total_econ'].mean():.2f}"
+    
+    # Look up a single tile by grid coordinates
+    result = tiles.loc[(10, 5), 'depth_m']
     """
-    local_vars = {'df': DF, 'pd': pd}
     print(f"[query_data] Executing:\n{code}")
     
     try:
-        exec(code, {}, local_vars)
-        if 'result' not in local_vars:
+        result = _run_query(code, 'result', data_version())
+        if result is _MISSING:
             return "ERROR: Code did not assign 'result' variable."
         
-        result = local_vars['result']
         return str(result)
     except Exception as e:
         return f"ERROR: {str(e)}"
@@ -114,10 +195,14 @@ def query_and_highlight(code: str):
     Use this tool when you want to find AND highlight specific tiles on the map.
     
     The dataframe 'df' has columns like: 'row', 'col', 'depth_m', 'biome', 'resource_economic_value', etc.
+    'tiles' is df indexed by (row, col), so 'row' and 'col' are index levels there, not columns:
+    use tiles.loc[(row, col)] to look up specific tiles, and tiles.reset_index() to get them back as columns.
+    'pd' (pandas) and 'np' (NumPy) are already imported.
     
     You MUST assign the final result to a variable named 'result_rows'.
-    'result_rows' MUST be a list of dictionaries with BOTH 'row' AND 'col' keys.
-    Optionally include 'color' key: [r, g, b] or [r, g, b, a].
+    'result_rows' MUST be a DataFrame with 'row' AND 'col' columns (fastest), or a list of
+    dictionaries with BOTH 'row' AND 'col' keys.
+    Optionally include a 'color' column/key: [r, g, b] or [r, g, b, a].
     Example: [{'row': 1, 'col': 2, 'color': [255,0,0]}, {'row': 3, 'col': 4}]
     
     The tiles will be AUTOMATICALLY highlighted. You only need to return the row/col pairs.
@@ -126,46 +211,35 @@ def query_and_highlight(code: str):
     # Find top 5 richest tiles
     df['total_econ'] = df['resource_economic_value'].apply(lambda x: sum(x) if len(x) > 0 else 0)
     top_5 = df.nlargest(5, 'total_econ')
-    result_rows = top_5[['row', 'col']].to_dict('records')
+    result_rows = top_5[['row', 'col']]
     
     # Find all tiles deeper than 3000m
     deep_tiles = df[df['depth_m'] > 3000]
-    result_rows = deep_tiles[['row', 'col']].to_dict('records')
+    result_rows = deep_tiles[['row', 'col']]
     """
-    local_vars = {'df': DF, 'pd': pd}
     print(f"[query_and_highlight] Executing:\n{code}")
     
     try:
-        exec(code, {}, local_vars)
+        result_rows = _run_query(code, 'result_rows', data_version())
         
-        if 'result_rows' not in local_vars:
+        if result_rows is _MISSING:
             return "ERROR: Code did not assign 'result_rows' variable."
         
-        result_rows = local_vars['result_rows']
         
-        if not isinstance(result_rows, list):
-            return f"ERROR: result_rows must be a list, got {type(result_rows).__name__}"
+        if not isinstance(result_rows, (list, pd.DataFrame)):
+            return f"ERROR: result_rows must be a list or DataFrame, got {type(result_rows).__name__}"
         
         if len(result_rows) == 0:
             return "SUCCESS: Query executed but returned 0 tiles (nothing to highlight)"
         
         # Validate each tile has row and col
-        validated_tiles = []
-        for tile in result_rows:
-            if isinstance(tile, dict) and 'row' in tile and 'col' in tile:
-                try:
-                    t = {'row': int(tile['row']), 'col': int(tile['col'])}
-                    if 'color' in tile:
-                        t['color'] = tile['color']
-                    validated_tiles.append(t)
-                except (ValueError, TypeError):
-                    pass
+        coords, colors = _validate_tiles(result_rows, 'query_and_highlight')
         
-        if len(validated_tiles) == 0:
+        if len(coords) == 0:
             return f"ERROR: No valid tiles. Each tile must have 'row' and 'col' keys. Got: {result_rows[:3]}"
         
         # Return special format that main.py will parse for highlighting
-        return f"HIGHLIGHT:{str(validated_tiles)}"
+        return _highlight_payload(coords, colors)
         
     except Exception as e:
         return f"ERROR: {str(e)}"
@@ -1,6 +1,15 @@
 import pandas as pd
+import json
 import os
 
+from app.optimizer import parquet_path, read_merged_csv, write_parquet
+
+def to_json_list(values):
+    """Serializes an aggregated list cell as JSON (NaN -> null) so loaders can decode it natively."""
+    if not isinstance(values, list):
+        return values
+    return json.dumps([None if pd.isna(v) else v for v in values], default=lambda o: o.item())
+
 def main():
     base_dir = 'Abyssal_World'
     cells_path = os.path.join(base_dir, 'cells.csv')
@@ -66,6 +75,10 @@ def main():
                         return lst
                     df_agg[prey_col] = df_agg[prey_col].apply(clean_prey)
 
+            # Write lists as JSON rather than Python reprs
+            for c in value_cols:
+                df_agg[c] = df_agg[c].map(to_json_list)
+
             df_other = df_agg
             print(f"  Aggregated shape: {df_other.shape}")
 
@@ -93,6 +106,8 @@ def main():
                     'prey': 'biome_prey',
                     'interaction_strength': 'biome_interaction_strengths'
                 }, inplace=True)
+                for c in ['biome_predators', 'biome_prey', 'biome_interaction_strengths']:
+                    df_food_agg[c] = df_food_agg[c].map(to_json_list)
                 
                 df_cells = pd.merge(df_cells, df_food_agg, left_on='biome', right_on=group_col, how='left')
                 
@@ -105,6 +120,11 @@ def main():
 
     print(f"Saving merged data to {merged_path}...")
     df_cells.to_csv(merged_path, index=False)
+
+    # Parsed copy for the app, so it never has to re-parse the CSV
+    cache_path = parquet_path(merged_path)
+    print(f"Saving parsed cache to {cache_path}...")
+    write_parquet(read_merged_csv(merged_path), cache_path)
     print("Done.")
 
 if __name__ == "__main__":